@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import concurrent.futures
+from concurrent.futures import Future
+from typing import Callable
+
+# Normalise a location so "Taupō", " taupo " and "TAUPO" share one cache entry
+def normalize_location(location: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", location)
+    stripped = "".join(character for character in decomposed if not unicodedata.combining(character))
+    return " ".join(stripped.lower().split())
+
+# Disk backed cache of serialised results with TTL, size bounded eviction and one in-flight call per key
+class AttractionCache:
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int, wait_timeout_seconds: float = 120):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # How long a caller waits for another caller's in-flight result before computing it itself
+        self.wait_timeout_seconds = wait_timeout_seconds
+        # Streamlit serves every session from threads of one process, the lock guards the connection and in_flight
+        self.lock = threading.Lock()
+        self.in_flight: dict[str, Future] = {}
+        self.connection = sqlite3.connect(path, check_same_thread = False, timeout = 30)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self.connection.commit()
+
+    # Cache key from normalised location, local data flag and knowledge base version
+    @staticmethod
+    def make_key(location: str, should_query_local_data: bool, knowledge_base_version: str) -> str:
+        return f"{knowledge_base_version}|{int(should_query_local_data)}|{normalize_location(location)}"
+
+    # Cache key for an analyse_input result from the normalised prompt and knowledge base version
+    @staticmethod
+    def make_analysis_key(user_input: str, knowledge_base_version: str) -> str:
+        return f"{knowledge_base_version}|analyse_input|{normalize_location(user_input)}"
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            return self._get(key)
+
+    def set(self, key: str, value: str):
+        with self.lock:
+            self._set(key, value)
+
+    # Return the cached value or compute it, concurrent callers for the same key wait for the first caller's result
+    def get_or_compute(self, key: str, compute: Callable[[], str | None]) -> str | None:
+        while True:
+            with self.lock:
+                value = self._get(key)
+                if value != None:
+                    return value
+                future = self.in_flight.get(key)
+                is_leader = future == None
+                if is_leader:
+                    future = Future()
+                    self.in_flight[key] = future
+
+            if is_leader:
+                break
+            try:
+                return future.result(timeout = self.wait_timeout_seconds)
+            except concurrent.futures.CancelledError:
+                # The first caller was interrupted, e.g. by a Streamlit rerun or stop, so try again
+                continue
+            except concurrent.futures.TimeoutError:
+                return self.compute_and_set(key, compute)
+
+        try:
+            value = self.compute_and_set(key, compute)
+        except Exception as e:
+            self.release(key)
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Streamlit's rerun and stop signals are not Exceptions, waiting callers retry instead of receiving them
+            self.release(key)
+            future.cancel()
+            raise
+        self.release(key)
+        future.set_result(value)
+        return value
+
+    def compute_and_set(self, key: str, compute: Callable[[], str | None]) -> str | None:
+        value = compute()
+        # Failed extractions are not cached so the next request retries
+        if value != None:
+            self.set(key, value)
+        return value
+
+    def release(self, key: str):
+        with self.lock:
+            del self.in_flight[key]
+
+    def _get(self, key: str) -> str | None:
+        now = time.time()
+        row = self.connection.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row == None:
+            return None
+        value, created_at = row
+        if now - created_at > self.ttl_seconds:
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.connection.commit()
+            return None
+        self.connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self.connection.commit()
+        return value
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        self.connection.execute("INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)", (key, value, now, now))
+        # Evict expired entries, then least recently used entries above the size bound
+        self.connection.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self.connection.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.connection.commit()
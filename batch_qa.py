@@ -0,0 +1,125 @@
+import os
+import time
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from openai import OpenAI
+from retrieval import knowledge_bases, get_collection, query_context, context_message
+from prompt_layout import build_messages, get_cached_tokens
+from model_router import ModelRouter
+
+# Headless Q&A over the task2/task6 knowledge bases, e.g.
+# python batch_qa.py task2 questions.jsonl answers.jsonl --concurrency 8
+# Each input line is {"id": ..., "question": ...} (id defaults to the line number), each output line records the
+# answer, retrieved chunk ids and timings. Questions already answered in the output file are skipped, so an
+# interrupted run resumes by running the same command again.
+
+# Get api key and base url from .env file
+load_dotenv()
+openai_base_url = os.getenv("OPENAI_BASE_URL")
+openai_api_key = os.getenv("OPENAI_API_KEY")
+
+def read_questions(path: str) -> list[dict]:
+    questions = []
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start = 1):
+            if line.strip() == '':
+                continue
+            question = json.loads(line)
+            questions.append({"id": str(question.get("id", line_number)), "question": question["question"]})
+    return questions
+
+# Ids answered without error by a previous run
+def read_answered_ids(path: str) -> set[str]:
+    answered_ids = set()
+    if not os.path.exists(path):
+        return answered_ids
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                answer = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line may be cut short if the previous run was killed mid-write
+                continue
+            if answer.get("error") == None:
+                answered_ids.add(answer["id"])
+    return answered_ids
+
+# Same message layout as the first turn in task2.py/task6.py
+def answer_question(router: ModelRouter, system_prompt: str, question: str, context: str) -> dict:
+    history = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question},
+    ]
+    start = time.perf_counter()
+    response = router.create(
+        "generate",
+        messages = build_messages(history, [context_message(question, context)]),
+    )
+    return {
+        "answer": response.choices[0].message.content,
+        "llm_seconds": time.perf_counter() - start,
+        "prompt_tokens": response.usage.prompt_tokens if response.usage != None else None,
+        "cached_tokens": get_cached_tokens(response.usage),
+    }
+
+def run(name: str, input_path: str, output_path: str, concurrency: int, batch_size: int, n_results: int):
+    collection = get_collection(name)
+    system_prompt = knowledge_bases[name]["system_prompt"]
+    client = OpenAI(
+        base_url = openai_base_url,
+        api_key = openai_api_key,
+    )
+    router = ModelRouter(client)
+
+    questions = read_questions(input_path)
+    answered_ids = read_answered_ids(output_path)
+    pending = [question for question in questions if question["id"] not in answered_ids]
+    print(f"{len(questions)} questions, {len(questions) - len(pending)} already answered, {len(pending)} to go")
+
+    write_lock = threading.Lock()
+    with open(output_path, "a") as output_file, ThreadPoolExecutor(max_workers = concurrency) as executor:
+        # Each answer is flushed as soon as it is written, the output file is the checkpoint
+        def process(question: dict, chunk_ids: list[str], context: str, retrieval_seconds: float):
+            record = {"id": question["id"], "question": question["question"], "chunk_ids": chunk_ids}
+            try:
+                result = answer_question(router, system_prompt, question["question"], context)
+                record["answer"] = result["answer"]
+                record["timings"] = {"retrieval_seconds": retrieval_seconds, "llm_seconds": result["llm_seconds"]}
+                record["prompt_tokens"] = result["prompt_tokens"]
+                record["cached_tokens"] = result["cached_tokens"]
+            except Exception as e:
+                record["error"] = str(e)
+            with write_lock:
+                output_file.write(json.dumps(record) + "\n")
+                output_file.flush()
+
+        for batch_start in range(0, len(pending), batch_size):
+            batch = pending[batch_start:batch_start + batch_size]
+            # Embed and query every question of the batch in one call
+            start = time.perf_counter()
+            contexts = query_context(collection, [question["question"] for question in batch], n_results = n_results)
+            retrieval_seconds = (time.perf_counter() - start) / len(batch)
+
+            futures = [
+                executor.submit(process, question, chunk_ids, context, retrieval_seconds)
+                for question, (chunk_ids, context) in zip(batch, contexts)
+            ]
+            for future in futures:
+                future.result()
+            print(f"Answered {min(batch_start + batch_size, len(pending))}/{len(pending)}")
+
+    print(json.dumps(router.stats(), indent = 2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Answer questions from a JSONL file against a local knowledge base")
+    parser.add_argument("knowledge_base", choices = [name for name, knowledge_base in knowledge_bases.items() if "system_prompt" in knowledge_base])
+    parser.add_argument("input_path", help = "JSONL file of questions")
+    parser.add_argument("output_path", help = "JSONL file of answers, appended to and used to resume")
+    parser.add_argument("--concurrency", type = int, default = 8, help = "Maximum number of concurrent LLM calls")
+    parser.add_argument("--batch-size", type = int, default = 256, help = "Number of questions embedded per query call")
+    parser.add_argument("--n-results", type = int, default = 20, help = "Number of chunks retrieved per question")
+    args = parser.parse_args()
+    run(args.knowledge_base, args.input_path, args.output_path, args.concurrency, args.batch_size, args.n_results)
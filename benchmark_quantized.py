@@ -0,0 +1,92 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+import chromadb
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from retrieval import knowledge_bases
+from quantized_index import QuantizedCollection, storage_modes, export_collection, build_index
+
+# Compare the float32 Chroma collections with the quantized indexes (see quantized_index.py):
+# index size, load time, query latency and recall@k against exact float32 search, e.g.
+# python benchmark_quantized.py task2 task6 --queries 200 --k 20
+
+def get_directory_size_mb(path: str) -> float:
+    size = 0
+    for directory, _, file_names in os.walk(path):
+        for file_name in file_names:
+            size += os.path.getsize(os.path.join(directory, file_name))
+    return size / (1024 * 1024)
+
+def get_recall(results: list[list[str]], expected: list[list[str]]) -> float:
+    hits = sum(len(set(result) & set(truth)) for result, truth in zip(results, expected))
+    return hits / sum(len(truth) for truth in expected)
+
+# Latency percentiles in ms and the ids returned for each query
+def time_queries(collection, query_embeddings: np.ndarray, k: int) -> tuple[float, float, list[list[str]]]:
+    latencies = []
+    ids = []
+    for query in query_embeddings:
+        start = time.perf_counter()
+        results = collection.query(query_embeddings = [query], n_results = k)
+        latencies.append(time.perf_counter() - start)
+        ids.append(results["ids"][0])
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, ids
+
+def print_row(name: str, size_mb: str, load_seconds: float, p50: float, p95: float, recall: float):
+    print(f"{name:<22}{size_mb:>22}{load_seconds * 1000:>12.1f}{p50:>10.2f}{p95:>10.2f}{recall:>10.3f}")
+
+def benchmark(name: str, n_queries: int, k: int, rescore_factor: int):
+    path = knowledge_bases[name]["path"]
+
+    start = time.perf_counter()
+    chroma_client = chromadb.PersistentClient(path = path)
+    collection = chroma_client.get_collection(name = name)
+    # The HNSW index is loaded on the first query
+    collection.query(query_embeddings = [np.zeros(384, dtype = np.float32)], n_results = 1)
+    chroma_load_seconds = time.perf_counter() - start
+
+    ids, documents, embeddings = export_collection(collection)
+    k = min(k, len(ids))
+
+    # Queries are the opening text of randomly chosen chunks, embedded once so latency excludes the model
+    random.seed(0)
+    query_texts = [document[:200] for document in random.sample(documents, min(n_queries, len(documents)))]
+    query_embeddings = np.array(DefaultEmbeddingFunction()(query_texts), dtype = np.float32)
+
+    # Ground truth: exact float32 search over every chunk
+    distances = (embeddings ** 2).sum(axis = 1)[None, :] - 2 * query_embeddings @ embeddings.T
+    expected = [[ids[row] for row in np.argsort(row_distances)[:k]] for row_distances in distances]
+
+    print(f"\n{name}: {len(ids)} chunks, {len(query_texts)} queries, recall@{k}")
+    print(f"{'storage':<22}{'size MB (mmapped)':>22}{'load ms':>12}{'p50 ms':>10}{'p95 ms':>10}{'recall':>10}")
+    p50, p95, results = time_queries(collection, query_embeddings, k)
+    print_row("chroma float32 hnsw", f"{get_directory_size_mb(path):.2f}", chroma_load_seconds, p50, p95, get_recall(results, expected))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in storage_modes:
+            index_path = os.path.join(directory, mode)
+            build_index(collection, index_path, mode)
+            start = time.perf_counter()
+            quantized_collection = QuantizedCollection(index_path, rescore_factor = rescore_factor)
+            load_seconds = time.perf_counter() - start
+            p50, p95, results = time_queries(quantized_collection, query_embeddings, k)
+            mmapped_size_mb = sum(os.path.getsize(os.path.join(index_path, file_name)) for file_name in ["full.npy", "documents.npy"]) / (1024 * 1024)
+            in_memory_size_mb = get_directory_size_mb(index_path) - mmapped_size_mb
+            print_row(f"{mode} + rescore", f"{in_memory_size_mb:.2f} ({mmapped_size_mb:.2f})", load_seconds, p50, p95, get_recall(results, expected))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark quantized indexes against the float32 Chroma collections")
+    parser.add_argument("knowledge_bases", nargs = "*", default = list(knowledge_bases), choices = list(knowledge_bases))
+    parser.add_argument("--queries", type = int, default = 200, help = "Number of queries")
+    parser.add_argument("--k", type = int, default = 20, help = "Number of results per query, the apps use 20")
+    parser.add_argument("--rescore-factor", type = int, default = 4, help = "Candidates re-scored per result")
+    args = parser.parse_args()
+    for name in args.knowledge_bases:
+        try:
+            benchmark(name, args.queries, args.k, args.rescore_factor)
+        except Exception as e:
+            print(f"\n{name}: skipped, {e}")
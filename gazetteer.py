@@ -0,0 +1,194 @@
+import os
+import re
+import json
+from collections import deque
+from attraction_cache import normalize_location
+
+gazetteer_path = "./db/task3/gazetteer.json"
+
+# Known place names for each local document, the first name is the location the document covers
+document_places = {
+    "auckland_attraction.pdf": ["Auckland", "Tāmaki Makaurau"],
+    "hamilton_waikato_attraction.pdf": ["Hamilton", "Waikato", "Kirikiriroa"],
+    "rotorua_attraction.pdf": ["Rotorua"],
+    "taupo_attraction.pdf": ["Taupō", "Tūrangi"],
+    "tauranga_bay_of_plenty_attraction.pdf": ["Tauranga", "Bay of Plenty", "Mount Maunganui"],
+}
+
+# Named features such as "Lake Rotoiti", "Mount Eden", "Waiheke Island" or "Hot Water Beach"
+place_name_pattern = re.compile(
+    r"\b(?:(?:Lake|Mount|Mt)\s+[A-ZĀĒĪŌŪ][\wāēīōū'-]+"
+    r"|(?:[A-ZĀĒĪŌŪ][\wāēīōū'-]+\s+){1,3}(?:Island|Bay|Beach|Falls|River|Harbour|Peninsula|Forest|Gorge|Springs))\b"
+)
+
+# Capitalised words which start a phrase such as "The Bay" or "Our Beach" without being part of a place name
+place_name_stopwords = {
+    "a", "an", "and", "another", "any", "at", "by", "each", "every", "for", "from", "her", "here", "his", "in", "its",
+    "my", "of", "on", "or", "our", "some", "that", "the", "their", "there", "these", "this", "those", "to", "we",
+    "with", "you", "your",
+}
+
+# Place names mentioned in a page of a document
+def find_place_names(text: str) -> set[str]:
+    place_names = set()
+    for match in place_name_pattern.finditer(text):
+        words = match.group().split()
+        while len(words) > 0 and words[0].lower() in place_name_stopwords:
+            words = words[1:]
+        # A capitalised word at the start of a sentence may not belong to the name, e.g. "Visit Hot Water Beach"
+        preceding = text[:match.start()].rstrip()
+        at_sentence_start = preceding == "" or preceding[-1] in ".!?:"
+        if at_sentence_start and len(words) == len(match.group().split()) and len(words) > 2:
+            words = words[1:]
+        # A feature word alone, e.g. "Bay" from "The Bay", is not a name
+        if len(words) >= 2:
+            place_names.add(" ".join(words))
+    return place_names
+
+# Words after a name which make it a different place, e.g. "Hamilton Island" is not Hamilton
+place_feature_words = {"island", "bay", "beach", "falls", "river", "harbour", "peninsula", "forest", "gorge", "springs", "lake", "mount"}
+
+# Words which can follow a name and still refer to the same place, e.g. "Hamilton, New Zealand" or "Rotorua District"
+region_suffixes = {"new zealand", "nz", "aotearoa", "north island", "city", "region", "district"}
+
+# Names for a document, documents without known names fall back to their file name
+def get_seed_places(document: str) -> list[str]:
+    if document in document_places:
+        return document_places[document]
+    stem = os.path.splitext(document)[0].removesuffix("_attraction")
+    return [stem.replace("_", " ").title()]
+
+# Gazetteer entries: seed names and named features found in exactly one document,
+# which all resolve to the location the document covers
+def build_entries(place_names_by_document: dict[str, set[str]]) -> list[dict]:
+    entries = []
+    seen_aliases = set()
+    for document in place_names_by_document:
+        seed_places = get_seed_places(document)
+        for place in seed_places:
+            entries.append({"alias": place, "location": seed_places[0], "document": document})
+            seen_aliases.add(normalize_location(place))
+
+    documents_by_alias = {}
+    for document, place_names in place_names_by_document.items():
+        for place_name in place_names:
+            documents_by_alias.setdefault(normalize_location(place_name), (place_name, set()))[1].add(document)
+    for alias, (place_name, documents) in sorted(documents_by_alias.items()):
+        if alias in seen_aliases or len(documents) != 1:
+            continue
+        document = documents.pop()
+        entries.append({"alias": place_name, "location": get_seed_places(document)[0], "document": document})
+    return entries
+
+def save_entries(entries: list[dict], path: str = gazetteer_path):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, "w") as file:
+        json.dump({"entries": entries}, file, ensure_ascii = False, indent = 2)
+        file.close()
+
+# Aho-Corasick matcher over normalised text, so every alias is found in one pass over the prompt
+class Gazetteer:
+    def __init__(self, entries: list[dict]):
+        self.entries = entries
+        self.lengths = []
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail = [0]
+        self.output: list[list[int]] = [[]]
+
+        for index, entry in enumerate(entries):
+            alias = normalize_location(entry["alias"])
+            self.lengths.append(len(alias))
+            node = 0
+            for character in alias:
+                if character not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][character] = len(self.goto) - 1
+                node = self.goto[node][character]
+            self.output[node].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback != 0 and character not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(character, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    @classmethod
+    def load(cls, path: str = gazetteer_path) -> "Gazetteer":
+        with open(path, "r") as file:
+            entries = json.load(file)["entries"]
+            file.close()
+        return cls(entries)
+
+    # Gazetteer built at ingest time if available, otherwise from the seed names of the local documents
+    @classmethod
+    def load_or_seed(cls, documents: list[str], path: str = gazetteer_path) -> "Gazetteer":
+        if os.path.exists(path):
+            return cls.load(path)
+        return cls(build_entries({document: set() for document in documents}))
+
+    # Entries matched in the text as whole words, longest match first, in order of appearance
+    def find(self, text: str) -> list[dict]:
+        text = normalize_location(text)
+        matches = []
+        node = 0
+        for position, character in enumerate(text):
+            while node != 0 and character not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(character, 0)
+            for index in self.output[node]:
+                start = position - self.lengths[index] + 1
+                end = position + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    following = text[end:].split(maxsplit = 1)
+                    if len(following) > 0 and following[0].strip(".,;:!?") in place_feature_words:
+                        continue
+                    matches.append((start, end, index))
+
+        matches.sort(key = lambda match: (match[0], match[0] - match[1]))
+        entries = []
+        last_end = 0
+        for start, end, index in matches:
+            if start >= last_end:
+                entries.append(self.entries[index])
+                last_end = end
+        return entries
+
+    # Locations covered by local documents mentioned in the text, one per document
+    def find_locations(self, text: str) -> list[str]:
+        locations = []
+        documents = set()
+        for entry in self.find(text):
+            if entry["document"] not in documents and entry["location"] not in locations:
+                documents.add(entry["document"])
+                locations.append(entry["location"])
+        return locations
+
+    # Entry whose alias is the whole location, optionally followed by region words or other names of the same document,
+    # so "Hamilton, Waikato" resolves but "Hamilton Island" or "near Hamilton" do not
+    def resolve(self, location: str) -> dict | None:
+        words = re.sub(r"[^\w\s]", " ", normalize_location(location)).split()
+        for entry in self.entries:
+            alias = re.sub(r"[^\w\s]", " ", normalize_location(entry["alias"])).split()
+            if words[:len(alias)] != alias:
+                continue
+            rest = " ".join(words[len(alias):])
+            document_aliases = {normalize_location(other["alias"]) for other in self.entries if other["document"] == entry["document"]}
+            while rest != "":
+                suffix = next((suffix for suffix in region_suffixes | document_aliases if rest == suffix or rest.startswith(suffix + " ")), None)
+                if suffix == None:
+                    break
+                rest = rest[len(suffix):].strip()
+            if rest == "":
+                return entry
+        return None
+
+    # Whether a location is one of the places with a local document
+    def is_local(self, location: str) -> bool:
+        return self.resolve(location) != None
@@ -0,0 +1,178 @@
+import os
+import gc
+import json
+import time
+import queue
+import threading
+from typing import Callable, Iterator
+import chromadb
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.document_loaders import TextLoader
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Streaming ingestion for the init scripts: pages are loaded lazily and flow through
+# page -> chunks -> embedding batches -> upsert, so memory stays flat however large the document is.
+# Every upserted batch is recorded in a checkpoint, a job that dies partway resumes from the last committed batch.
+# The memory ceiling is a soft throttle: above it batches shrink and the producer waits for queued batches,
+# the peak resident set size of each file is reported so runs can be checked against it.
+
+# Resident set size of this process in MB, None where /proc is not available
+def get_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            resident_pages = int(file.read().split()[1])
+            file.close()
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def load_pages(file_path: str) -> Iterator[Document]:
+    if file_path.endswith(".pdf"):
+        return PyPDFLoader(file_path).lazy_load()
+    elif file_path.endswith(".txt"):
+        return TextLoader(file_path).lazy_load()
+    raise ValueError(f"Unsupported file type: {file_path}")
+
+# Chunks of each page with their sequence number in the file, chunk ids are derived from it so re-ingesting a batch overwrites it
+def chunk_pages(pages: Iterator[Document], text_splitter: RecursiveCharacterTextSplitter) -> Iterator[tuple[int, Document]]:
+    sequence = 0
+    for page in pages:
+        for chunk in text_splitter.split_documents([page]):
+            yield sequence, chunk
+            sequence += 1
+
+# Batches of chunks, the size of each batch is read when it is started
+def batch_chunks(chunks: Iterator[tuple[int, Document]], get_batch_size: Callable[[], int]) -> Iterator[list[tuple[int, Document]]]:
+    batch = []
+    batch_size = get_batch_size()
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+            batch_size = get_batch_size()
+    if len(batch) > 0:
+        yield batch
+
+# Number of chunks committed for each file
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+        self.committed = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self.committed = json.load(file)
+                file.close()
+
+    def get(self, file_path: str) -> int:
+        return self.committed.get(file_path, 0)
+
+    # Written to a temporary file and renamed, so a crash never leaves a partial checkpoint
+    def commit(self, file_path: str, chunks: int):
+        self.committed[file_path] = chunks
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.committed, file)
+            file.close()
+        os.replace(temporary_path, self.path)
+
+    def clear(self):
+        self.committed = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# Load, split and batch a file on a producer thread. The bounded queue applies backpressure when embedding falls behind.
+# Above the memory ceiling the batch size is halved, down to one chunk, and the producer waits until the queued batches
+# have been upserted. Below the ceiling the batch size grows back to batch_size.
+def produce_batches(
+    file_path: str,
+    text_splitter: RecursiveCharacterTextSplitter,
+    batch_size: int,
+    skip_chunks: int,
+    max_memory_mb: float,
+    batches: queue.Queue,
+    on_page: Callable[[str, Document], None] | None,
+):
+    try:
+        def pages() -> Iterator[Document]:
+            for page in load_pages(file_path):
+                if on_page != None:
+                    on_page(file_path, page)
+                yield page
+
+        current_batch_size = batch_size
+
+        def get_batch_size() -> int:
+            nonlocal current_batch_size
+            rss_mb = get_rss_mb()
+            if rss_mb != None and rss_mb > max_memory_mb:
+                current_batch_size = max(1, current_batch_size // 2)
+            else:
+                current_batch_size = min(batch_size, current_batch_size * 2)
+            return current_batch_size
+
+        # Chunks before the checkpoint are split again but not embedded
+        chunks = (chunk for chunk in chunk_pages(pages(), text_splitter) if chunk[0] >= skip_chunks)
+        for batch in batch_chunks(chunks, get_batch_size):
+            rss_mb = get_rss_mb()
+            while rss_mb != None and rss_mb > max_memory_mb and not batches.empty():
+                gc.collect()
+                time.sleep(0.05)
+                rss_mb = get_rss_mb()
+            batches.put(batch)
+        batches.put(None)
+    except Exception as e:
+        batches.put(e)
+
+def stream_ingest(
+    file_paths: list[str],
+    collection_name: str,
+    client: chromadb.ClientAPI,
+    embedding_function: Embeddings,
+    checkpoint_path: str,
+    batch_size: int = 64,
+    max_memory_mb: float = 1024,
+    max_pending_batches: int = 2,
+    resume: bool = False,
+    on_page: Callable[[str, Document], None] | None = None,
+):
+    vector_store = Chroma(
+        collection_name = collection_name,
+        client = client,
+        embedding_function = embedding_function,
+    )
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size = 1000, chunk_overlap = 100)
+    checkpoint = Checkpoint(checkpoint_path)
+    if not resume:
+        checkpoint.clear()
+
+    for file_path in file_paths:
+        committed = checkpoint.get(file_path)
+        peak_rss_mb = get_rss_mb()
+        batches = queue.Queue(maxsize = max_pending_batches)
+        producer = threading.Thread(
+            target = produce_batches,
+            args = (file_path, text_splitter, batch_size, committed, max_memory_mb, batches, on_page),
+            daemon = True,
+        )
+        producer.start()
+
+        while (batch := batches.get()) != None:
+            if isinstance(batch, Exception):
+                raise batch
+            vector_store.add_documents(
+                documents = [chunk for _, chunk in batch],
+                ids = [f"{os.path.basename(file_path)}:{sequence}" for sequence, _ in batch],
+            )
+            committed = batch[-1][0] + 1
+            checkpoint.commit(file_path, committed)
+            rss_mb = get_rss_mb()
+            if rss_mb != None and (peak_rss_mb == None or rss_mb > peak_rss_mb):
+                peak_rss_mb = rss_mb
+        producer.join()
+        peak = f"{peak_rss_mb:.0f} MB" if peak_rss_mb != None else "unknown"
+        print(f"Ingested {file_path}: {committed} chunks, peak RSS {peak} (ceiling {max_memory_mb:.0f} MB)")
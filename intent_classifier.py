@@ -0,0 +1,158 @@
+import os
+import time
+import json
+import argparse
+import numpy as np
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+# Local fast path for task4's analyse_input: a nearest-centroid classifier over the same all-MiniLM-L6-v2
+# embeddings Chroma uses, trained from the decisions the LLM classifier made, e.g.
+# python intent_classifier.py evaluate   (cross-validated agreement with the LLM and share of calls avoided)
+# python intent_classifier.py train      (write the model task4.py loads)
+
+log_path = "./db/task4/intent_log.jsonl"
+model_path = "./db/task4/intent_classifier.npz"
+
+# Same threshold task4.py applies to the LLM's confidence_score
+confidence_threshold = 0.7
+
+# Every decision task4.py acts on, a model is only trained once the log has examples of each
+intent_labels = ["new_document", "change_document", "neither"]
+
+embedding_function = None
+
+# Normalised embeddings, the model is loaded on first use
+def embed(texts: list[str]) -> np.ndarray:
+    global embedding_function
+    if embedding_function == None:
+        embedding_function = DefaultEmbeddingFunction()
+    embeddings = np.array(embedding_function(texts), dtype = np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis = 1, keepdims = True)
+
+# Decision task4.py acts on: a new document, a change to the document, or neither (including low confidence)
+def get_label(is_new_document_event: bool, is_change_document_event: bool, confidence_score: float) -> str:
+    if confidence_score < confidence_threshold:
+        return "neither"
+    if is_new_document_event:
+        return "new_document"
+    if is_change_document_event:
+        return "change_document"
+    return "neither"
+
+# Record a decision of the LLM classifier as training data
+def log_decision(text: str, is_new_document_event: bool, is_change_document_event: bool, confidence_score: float):
+    os.makedirs(os.path.dirname(log_path), exist_ok = True)
+    decision = {
+        "text": text,
+        "label": get_label(is_new_document_event, is_change_document_event, confidence_score),
+        "confidence_score": confidence_score,
+        "time": time.time(),
+    }
+    with open(log_path, "a") as file:
+        file.write(json.dumps(decision) + "\n")
+        file.close()
+
+def read_log(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        decisions = [json.loads(line) for line in file if line.strip() != '']
+        file.close()
+    return decisions
+
+class IntentClassifier:
+    def __init__(self, labels: list[str], centroids: np.ndarray, temperature: float):
+        self.labels = labels
+        self.centroids = centroids
+        self.temperature = temperature
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, labels: list[str], temperature: float = 20.0) -> "IntentClassifier":
+        classes = sorted(set(labels))
+        labels_array = np.array(labels)
+        centroids = np.stack([embeddings[labels_array == label].mean(axis = 0) for label in classes])
+        centroids = centroids / np.linalg.norm(centroids, axis = 1, keepdims = True)
+        return cls(classes, centroids, temperature)
+
+    # Label and confidence (softmax over scaled cosine similarity to each centroid) for each embedding
+    def predict(self, embeddings: np.ndarray) -> list[tuple[str, float]]:
+        scores = embeddings @ self.centroids.T * self.temperature
+        scores = scores - scores.max(axis = 1, keepdims = True)
+        probabilities = np.exp(scores) / np.exp(scores).sum(axis = 1, keepdims = True)
+        best = probabilities.argmax(axis = 1)
+        return [(self.labels[index], float(probabilities[row, index])) for row, index in enumerate(best)]
+
+    def predict_text(self, text: str) -> tuple[str, float]:
+        return self.predict(embed([text]))[0]
+
+    def save(self, path: str):
+        np.savez(path, labels = np.array(self.labels), centroids = self.centroids, temperature = self.temperature)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        data = np.load(path)
+        return cls([str(label) for label in data["labels"]], data["centroids"], float(data["temperature"]))
+
+# Labels with fewer than min_per_label logged decisions
+def get_missing_labels(decisions: list[dict], min_per_label: int) -> list[str]:
+    counts = {label: 0 for label in intent_labels}
+    for decision in decisions:
+        counts[decision["label"]] = counts.get(decision["label"], 0) + 1
+    return [label for label in intent_labels if counts[label] < min_per_label]
+
+def train(temperature: float, min_per_label: int):
+    decisions = read_log(log_path)
+    # With a single label the softmax is always 1.0 and task4.py would never ask the LLM again
+    missing_labels = get_missing_labels(decisions, min_per_label)
+    if len(missing_labels) > 0:
+        print(f"Not training, fewer than {min_per_label} logged decisions for: {missing_labels}")
+        return
+    embeddings = embed([decision["text"] for decision in decisions])
+    classifier = IntentClassifier.fit(embeddings, [decision["label"] for decision in decisions], temperature)
+    classifier.save(model_path)
+    print(f"Trained on {len(decisions)} decisions, labels: {classifier.labels}, saved to {model_path}")
+
+# Cross-validated agreement with the LLM classifier, and the share of LLM calls the fast path would avoid
+def evaluate(temperature: float, folds: int, min_per_label: int):
+    decisions = read_log(log_path)
+    missing_labels = get_missing_labels(decisions, min_per_label)
+    if len(decisions) == 0 or len(missing_labels) > 0:
+        print(f"Not evaluating, {len(decisions)} logged decisions and fewer than {min_per_label} for: {missing_labels}")
+        return
+    embeddings = embed([decision["text"] for decision in decisions])
+    labels = np.array([decision["label"] for decision in decisions])
+    fold_of = np.arange(len(decisions)) % folds
+
+    agree = 0
+    avoided = 0
+    agree_avoided = 0
+    for fold in range(folds):
+        train_rows = fold_of != fold
+        test_rows = fold_of == fold
+        if not train_rows.any() or not test_rows.any():
+            continue
+        classifier = IntentClassifier.fit(embeddings[train_rows], list(labels[train_rows]), temperature)
+        for (label, confidence), expected in zip(classifier.predict(embeddings[test_rows]), labels[test_rows]):
+            agree += label == expected
+            if confidence >= confidence_threshold:
+                avoided += 1
+                agree_avoided += label == expected
+
+    total = len(decisions)
+    print(f"Decisions: {total}")
+    print(f"Agreement with LLM (all predictions): {agree / total:.1%}")
+    print(f"LLM calls avoided (confidence >= {confidence_threshold}): {avoided / total:.1%}")
+    if avoided > 0:
+        print(f"Agreement with LLM on avoided calls: {agree_avoided / avoided:.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Train or evaluate the task4 local intent classifier")
+    parser.add_argument("command", choices = ["train", "evaluate"])
+    parser.add_argument("--temperature", type = float, default = 20.0, help = "Scale applied to cosine similarities before softmax")
+    parser.add_argument("--folds", type = int, default = 5, help = "Number of cross-validation folds for evaluate")
+    parser.add_argument("--min-per-label", type = int, default = 20, help = "Logged decisions of each label required to train or evaluate")
+    args = parser.parse_args()
+    if args.command == "train":
+        train(args.temperature, args.min_per_label)
+    else:
+        evaluate(args.temperature, args.folds, args.min_per_label)
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from collections import deque
+from dotenv import load_dotenv
+from typing import Callable
+import openai
+from openai import OpenAI
+from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
+from pydantic import ValidationError
+from structured_stream import stream_parse
+
+# Model for each kind of call, every route uses the Gpt4o deployment unless overridden, e.g. MODEL_CLASSIFY=<deployment name>
+load_dotenv()
+routes = {
+    "classify": os.getenv("MODEL_CLASSIFY", "Gpt4o"),
+    "extract": os.getenv("MODEL_EXTRACT", "Gpt4o"),
+    "generate": os.getenv("MODEL_GENERATE", "Gpt4o"),
+    "summarize": os.getenv("MODEL_SUMMARIZE", "Gpt4o"),
+}
+
+# Model a structured call escalates to when the routed model's output fails schema validation, is refused,
+# or reports a confidence_score below the threshold
+fallback_model = os.getenv("MODEL_FALLBACK", "Gpt4o")
+escalation_confidence = float(os.getenv("MODEL_ESCALATION_CONFIDENCE", 0.7))
+
+# Errors from the routed model which are retried with the fallback model, a misconfigured model is not one of them
+escalation_errors = (
+    ValidationError,
+    openai.LengthFinishReasonError,
+    openai.ContentFilterFinishReasonError,
+)
+
+# Whether a structured output from a routed model should be redone with the fallback model
+def should_escalate(completion: ParsedChatCompletion) -> bool:
+    parsed = completion.choices[0].message.parsed
+    if parsed == None:
+        return True
+    confidence_score = getattr(parsed, "confidence_score", None)
+    return confidence_score != None and confidence_score < escalation_confidence
+
+# Routes each call site to its configured model and keeps per-route latency and token metrics
+class ModelRouter:
+    def __init__(self, client: OpenAI):
+        self.client = client
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def model_for(self, route: str) -> str:
+        return routes[route]
+
+    # Whether a structured call on the route may be redone with the fallback model
+    def can_escalate(self, route: str) -> bool:
+        return self.model_for(route) != fallback_model
+
+    def create(self, route: str, **kwargs) -> ChatCompletion:
+        return self.timed(route, self.model_for(route), lambda model: self.client.chat.completions.create(model = model, **kwargs))
+
+    def parse(self, route: str, **kwargs) -> ParsedChatCompletion:
+        return self.with_escalation(route, lambda model: self.client.beta.chat.completions.parse(model = model, **kwargs))
+
+    # Streaming structured output (see structured_stream.py), an escalated call streams again from the start
+    def stream_parse(self, route: str, on_partial: Callable[[dict, set[str]], None], **kwargs) -> ParsedChatCompletion:
+        return self.with_escalation(
+            route,
+            lambda model: stream_parse(self.client, on_partial, model = model, stream_options = {"include_usage": True}, **kwargs),
+        )
+
+    def with_escalation(self, route: str, call: Callable[[str], ParsedChatCompletion]) -> ParsedChatCompletion:
+        model = self.model_for(route)
+        try:
+            completion = self.timed(route, model, call)
+            if model == fallback_model or not should_escalate(completion):
+                return completion
+        except escalation_errors:
+            if model == fallback_model:
+                raise
+        with self.lock:
+            self.route_metrics(route)["escalations"] += 1
+        return self.timed(route, fallback_model, call)
+
+    # A failed call is recorded too, so the cost of an escalated attempt shows in the route's metrics
+    def timed(self, route: str, model: str, call: Callable[[str], ChatCompletion]) -> ChatCompletion:
+        start = time.perf_counter()
+        try:
+            completion = call(model)
+        except Exception:
+            self.record(route, model, time.perf_counter() - start, None, error = True)
+            raise
+        self.record(route, model, time.perf_counter() - start, completion.usage)
+        return completion
+
+    # Metrics of a route, callers hold the lock
+    def route_metrics(self, route: str) -> dict:
+        return self.metrics.setdefault(route, {
+            "calls": {},
+            "errors": {},
+            "escalations": 0,
+            "latencies": deque(maxlen = 1000),
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        })
+
+    def record(self, route: str, model: str, elapsed: float, usage, error: bool = False):
+        with self.lock:
+            metrics = self.route_metrics(route)
+            metrics["calls"][model] = metrics["calls"].get(model, 0) + 1
+            if error:
+                metrics["errors"][model] = metrics["errors"].get(model, 0) + 1
+            metrics["latencies"].append(elapsed)
+            if usage != None:
+                metrics["prompt_tokens"] += usage.prompt_tokens
+                metrics["completion_tokens"] += usage.completion_tokens
+
+    # Per-route summary to compare latency and tokens against escalations
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {}
+            for route, metrics in self.metrics.items():
+                latencies = sorted(metrics["latencies"])
+                calls = sum(metrics["calls"].values())
+                if calls == 0:
+                    continue
+                stats[route] = {
+                    "calls": metrics["calls"],
+                    "errors": metrics["errors"],
+                    "escalations": metrics["escalations"],
+                    "latency_p50_seconds": latencies[len(latencies) // 2],
+                    "latency_p95_seconds": latencies[int(len(latencies) * 0.95)],
+                    "average_prompt_tokens": metrics["prompt_tokens"] / calls,
+                    "average_completion_tokens": metrics["completion_tokens"] / calls,
+                }
+            return stats
@@ -0,0 +1,44 @@
+import os
+from openai.types.completion_usage import CompletionUsage
+
+# Message layout mode, "legacy" records volatile context in the history like the apps originally did, so follow-up
+# questions still see the chunks retrieved for earlier turns. "prefix_cache" keeps volatile context out of the history
+# so the prompt prefix stays byte-stable and cacheable, at the cost of each call only seeing its own retrieved context.
+message_layout = os.getenv("MESSAGE_LAYOUT", "legacy")
+
+# Characters kept of a tool result from an earlier turn, the full result is only sent during the turn which produced it
+compacted_tool_characters = int(os.getenv("COMPACTED_TOOL_CHARACTERS", 200))
+
+# Record volatile context (retrieved chunks, per-prompt goals), returns the messages to send at the tail of each call
+def record_context(history: list, context_messages: list[dict]) -> list[dict]:
+    if message_layout == "legacy":
+        history.extend(context_messages)
+        return []
+    return context_messages
+
+# Tool result shortened to a stub, the same message always compacts to the same text so the prefix stays stable
+def compact_message(message: dict) -> dict:
+    content = message.get("content")
+    if message.get("role") != "tool" or content == None or len(content) <= compacted_tool_characters:
+        return message
+    return {**message, "content": f"{content[:compacted_tool_characters]}... [{len(content)} characters compacted]"}
+
+# Messages for one call: fixed system prompt and compacted history first, volatile context only at the tail.
+# Tool results before the latest user message are compacted, so the boundary only moves when a new turn starts.
+def build_messages(history: list, tail: list[dict]) -> list:
+    messages = list(history)
+    last_user = max((index for index, message in enumerate(messages) if message.get("role") == "user"), default = 0)
+    return [compact_message(message) if index < last_user else message for index, message in enumerate(messages)] + tail
+
+# Number of prompt tokens served from the provider's prompt cache
+def get_cached_tokens(usage: CompletionUsage | None) -> int:
+    if usage == None or usage.prompt_tokens_details == None:
+        return 0
+    return usage.prompt_tokens_details.cached_tokens or 0
+
+# Short summary of prompt caching and latency for one or more calls
+def format_usage(usages: list[CompletionUsage | None], elapsed: float) -> str:
+    prompt_tokens = sum(usage.prompt_tokens for usage in usages if usage != None)
+    cached_tokens = sum(get_cached_tokens(usage) for usage in usages)
+    cached_share = cached_tokens / prompt_tokens if prompt_tokens > 0 else 0
+    return f"Prompt tokens: {prompt_tokens}, cached: {cached_tokens} ({cached_share:.0%}), latency: {elapsed:.2f}s"
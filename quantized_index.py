@@ -0,0 +1,136 @@
+import os
+import json
+import argparse
+import numpy as np
+import chromadb
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+# Compact storage for chunk embeddings: candidates are found by scanning float16 or int8 scalar-quantized vectors,
+# then the top candidates are re-scored with the full precision vectors. The full vectors and the chunk texts
+# stay on disk and are memory-mapped, e.g.
+# python quantized_index.py task2 --mode int8
+# then run the apps with RETRIEVAL_STORAGE=int8
+
+storage_modes = ["float16", "int8"]
+
+# Rows scanned per block, bounds the temporary float32 copy made while scanning int8 codes
+scan_block_size = 65536
+
+def get_index_path(collection_path: str, mode: str) -> str:
+    return os.path.join(os.path.dirname(collection_path), f"quantized_{mode}")
+
+# All ids, documents and embeddings of a collection, read in pages
+def export_collection(collection: chromadb.Collection, page_size: int = 1000) -> tuple[list[str], list[str], np.ndarray]:
+    ids = []
+    documents = []
+    embeddings = []
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(include = ["documents", "embeddings"], limit = page_size, offset = offset)
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        embeddings.extend(page["embeddings"])
+    return ids, documents, np.array(embeddings, dtype = np.float32)
+
+def build_index(collection: chromadb.Collection, path: str, mode: str):
+    ids, documents, embeddings = export_collection(collection)
+    os.makedirs(path, exist_ok = True)
+
+    if mode == "float16":
+        codes = embeddings.astype(np.float16)
+        scale = np.ones(embeddings.shape[1], dtype = np.float32)
+    elif mode == "int8":
+        # Symmetric per-dimension scale, so each dimension uses the full int8 range
+        scale = np.abs(embeddings).max(axis = 0) / 127
+        scale[scale == 0] = 1
+        codes = np.round(embeddings / scale).astype(np.int8)
+    else:
+        raise ValueError(f"Unknown storage mode: {mode}")
+
+    np.save(os.path.join(path, "codes.npy"), codes)
+    np.save(os.path.join(path, "scale.npy"), scale.astype(np.float32))
+    np.save(os.path.join(path, "norms.npy"), (embeddings ** 2).sum(axis = 1))
+    np.save(os.path.join(path, "full.npy"), embeddings)
+    # Chunk texts as one UTF-8 buffer with the offset of each chunk, so only returned chunks are read
+    encoded_documents = [document.encode("utf-8") for document in documents]
+    offsets = np.zeros(len(encoded_documents) + 1, dtype = np.int64)
+    offsets[1:] = np.cumsum([len(document) for document in encoded_documents])
+    np.save(os.path.join(path, "documents.npy"), np.frombuffer(b"".join(encoded_documents), dtype = np.uint8))
+    np.save(os.path.join(path, "document_offsets.npy"), offsets)
+    # Written last, its modification time marks when the index was built
+    with open(os.path.join(path, "metadata.json"), "w") as file:
+        json.dump({"collection_id": str(collection.id), "mode": mode, "ids": ids}, file)
+        file.close()
+
+# Read-only collection over a quantized index with the part of the Chroma collection API the apps use.
+# Distances are squared L2 like the Chroma collections built by the init scripts.
+class QuantizedCollection:
+    def __init__(self, path: str, embedding_function: DefaultEmbeddingFunction | None = None, rescore_factor: int = 4):
+        self.codes = np.load(os.path.join(path, "codes.npy"))
+        self.scale = np.load(os.path.join(path, "scale.npy"))
+        self.norms = np.load(os.path.join(path, "norms.npy"))
+        self.full = np.load(os.path.join(path, "full.npy"), mmap_mode = "r")
+        self.document_data = np.load(os.path.join(path, "documents.npy"), mmap_mode = "r")
+        self.document_offsets = np.load(os.path.join(path, "document_offsets.npy"))
+        with open(os.path.join(path, "metadata.json"), "r") as file:
+            metadata = json.load(file)
+            file.close()
+        self.id = metadata["collection_id"]
+        self.mode = metadata["mode"]
+        self.ids = metadata["ids"]
+        self.embedding_function = embedding_function
+        self.rescore_factor = rescore_factor
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def document(self, row: int) -> str:
+        return self.document_data[self.document_offsets[row]:self.document_offsets[row + 1]].tobytes().decode("utf-8")
+
+    # Approximate ranking score, larger is closer: q.x - |x|^2 / 2 orders rows like -|q - x|^2
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        scaled_query = query * self.scale
+        scores = np.empty(len(self.codes), dtype = np.float32)
+        for start in range(0, len(self.codes), scan_block_size):
+            block = self.codes[start:start + scan_block_size].astype(np.float32)
+            scores[start:start + len(block)] = block @ scaled_query
+        return scores - self.norms / 2
+
+    def search(self, query: np.ndarray, n_results: int) -> tuple[np.ndarray, np.ndarray]:
+        n_results = min(n_results, len(self.codes))
+        n_candidates = min(n_results * self.rescore_factor, len(self.codes))
+        scores = self.approximate_scores(query)
+        candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        # Exact re-scoring, only the candidate rows are read from the memory-mapped full vectors
+        candidates = np.sort(candidates)
+        distances = ((self.full[candidates] - query) ** 2).sum(axis = 1)
+        order = np.argsort(distances)[:n_results]
+        return candidates[order], distances[order]
+
+    def query(self, query_texts: list[str] | None = None, query_embeddings: list | None = None, n_results: int = 10) -> dict:
+        if query_embeddings is None:
+            if self.embedding_function == None:
+                self.embedding_function = DefaultEmbeddingFunction()
+            query_embeddings = self.embedding_function(query_texts)
+
+        results = {"ids": [], "documents": [], "distances": []}
+        for query in np.array(query_embeddings, dtype = np.float32):
+            rows, distances = self.search(query, n_results)
+            results["ids"].append([self.ids[row] for row in rows])
+            results["documents"].append([self.document(row) for row in rows])
+            results["distances"].append([float(distance) for distance in distances])
+        return results
+
+if __name__ == "__main__":
+    from retrieval import knowledge_bases
+
+    parser = argparse.ArgumentParser(description = "Build a quantized index from a knowledge base collection")
+    parser.add_argument("knowledge_base", choices = list(knowledge_bases))
+    parser.add_argument("--mode", choices = storage_modes, default = "int8")
+    args = parser.parse_args()
+
+    collection_path = knowledge_bases[args.knowledge_base]["path"]
+    chroma_client = chromadb.PersistentClient(path = collection_path)
+    collection = chroma_client.get_collection(name = args.knowledge_base)
+    path = get_index_path(collection_path, args.mode)
+    build_index(collection, path, args.mode)
+    print(f"Built {args.mode} index of {collection.count()} chunks in {path}")
@@ -0,0 +1,93 @@
+import os
+import threading
+from dotenv import load_dotenv
+import chromadb
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from retrieval_service import RemoteCollection
+from quantized_index import QuantizedCollection, storage_modes, get_index_path
+
+# Knowledge bases built by the init scripts, with the system prompt of the Q&A apps using them
+knowledge_bases = {
+    "task2": {
+        "path": "./db/task2/chroma",
+        "system_prompt": "You're a helpful assistant which answer questions about files/contents stored in local knowledge base.",
+    },
+    "task3": {
+        "path": "./db/task3/chroma",
+    },
+    "task6": {
+        "path": "./db/task6/chroma",
+        "system_prompt": "You're a helpful assistant which answer questions about Front-end Innovation team.",
+    },
+}
+
+# Set to use the shared retrieval service (retrieval_service.py) instead of loading the model in this process
+load_dotenv()
+retrieval_service_url = os.getenv("RETRIEVAL_SERVICE_URL")
+# Storage for local collections, "chroma" for the float32 HNSW index or a quantized index mode (see quantized_index.py)
+retrieval_storage = os.getenv("RETRIEVAL_STORAGE", "chroma")
+
+# Quantized collections loaded in this process, kept across Streamlit reruns so the index and embedding model load once.
+# They are reloaded and checked again when the index or the Chroma store it was built from changes.
+quantized_collections = {}
+quantized_collections_lock = threading.Lock()
+
+def get_quantized_collection(name: str, index_path: str, embedding_function: DefaultEmbeddingFunction | None) -> QuantizedCollection:
+    chroma_database_path = os.path.join(knowledge_bases[name]["path"], "chroma.sqlite3")
+    version = (
+        os.path.getmtime(os.path.join(index_path, "metadata.json")),
+        os.path.getmtime(chroma_database_path) if os.path.exists(chroma_database_path) else None,
+    )
+    with quantized_collections_lock:
+        if index_path not in quantized_collections or quantized_collections[index_path][0] != version:
+            collection = QuantizedCollection(index_path, embedding_function)
+            if version[1] != None:
+                check_quantized_collection(name, collection)
+            quantized_collections[index_path] = (version, collection)
+        return quantized_collections[index_path][1]
+
+# A quantized index is stale once the init script has rebuilt or extended the Chroma collection it was built from
+def check_quantized_collection(name: str, collection: QuantizedCollection):
+    chroma_collection = chromadb.PersistentClient(path = knowledge_bases[name]["path"]).get_collection(name = name)
+    if str(chroma_collection.id) != collection.id or chroma_collection.count() != collection.count():
+        raise RuntimeError(f"The {collection.mode} index for {name} is out of date, rebuild it with: python quantized_index.py {name} --mode {collection.mode}")
+
+# Collection for a knowledge base in this process, using the configured storage
+def open_local_collection(name: str, embedding_function: DefaultEmbeddingFunction | None = None) -> chromadb.Collection | QuantizedCollection:
+    path = knowledge_bases[name]["path"]
+    if retrieval_storage in storage_modes:
+        index_path = get_index_path(path, retrieval_storage)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"No {retrieval_storage} index for {name}, build it with: python quantized_index.py {name} --mode {retrieval_storage}")
+        return get_quantized_collection(name, index_path, embedding_function)
+
+    chroma_client = chromadb.PersistentClient(path = path)
+    if embedding_function == None:
+        return chroma_client.get_collection(name = name)
+    return chroma_client.get_collection(name = name, embedding_function = embedding_function)
+
+# Local collection for a knowledge base, or a thin client of the shared retrieval service
+def get_collection(name: str) -> chromadb.Collection | QuantizedCollection | RemoteCollection:
+    if retrieval_service_url:
+        return RemoteCollection(retrieval_service_url, name)
+    return open_local_collection(name)
+
+# Query local data for a list of prompts in one call so all prompts are embedded as one batch,
+# returns the retrieved chunk ids and the joined context for each prompt
+def query_context(collection: chromadb.Collection | QuantizedCollection | RemoteCollection, prompts: list[str], n_results: int = 20) -> list[tuple[list[str], str]]:
+    results = collection.query(
+        query_texts = prompts,
+        n_results = n_results,
+    )
+    contexts = []
+    for ids, documents in zip(results['ids'], results['documents']):
+        context = ''
+        for chunk in documents:
+            context += f"""{chunk}\n\n"""
+        contexts.append((ids, context))
+    return contexts
+
+# Instruction to LLM, specifically ask LLM to answer only using context provided
+def context_message(prompt: str, context: str) -> dict:
+    message = f"Answer the question using only the context provided.\n\nQuestion: {prompt}\nContext:\n\n{context}\n"
+    return {"role": "system", "content": message}
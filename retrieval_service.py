@@ -0,0 +1,189 @@
+import time
+import json
+import queue
+import argparse
+import threading
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+# Local retrieval service shared by task2.py, task3.py and task6.py, so one copy of all-MiniLM-L6-v2 serves
+# every app and concurrent query embeddings are batched together, e.g.
+# python retrieval_service.py --port 8765
+# then run the apps with RETRIEVAL_SERVICE_URL=http://127.0.0.1:8765
+
+# Collects query texts from concurrent requests and embeds them in one model call
+class EmbeddingBatcher:
+    def __init__(self, embedding_function: DefaultEmbeddingFunction, max_batch_size: int, max_wait_seconds: float):
+        self.embedding_function = embedding_function
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target = self.run, daemon = True).start()
+
+    def embed(self, texts: list[str]) -> list:
+        future = Future()
+        self.queue.put((texts, future))
+        return future.result()
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            count = len(items[0][0])
+            # Wait briefly for other requests to join the batch
+            deadline = time.perf_counter() + self.max_wait_seconds
+            while count < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout = remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                count += len(item[0])
+
+            try:
+                embeddings = self.embedding_function([text for texts, _ in items for text in texts])
+                offset = 0
+                for texts, future in items:
+                    future.set_result(embeddings[offset:offset + len(texts)])
+                    offset += len(texts)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+
+            with self.lock:
+                self.batches += 1
+                self.texts += count
+
+class RetrievalService:
+    def __init__(self, collections: dict, embedding_function: DefaultEmbeddingFunction, max_batch_size: int, max_wait_seconds: float):
+        self.batcher = EmbeddingBatcher(embedding_function, max_batch_size, max_wait_seconds)
+        self.collections = collections
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.latencies = deque(maxlen = 1000)
+
+    def query(self, name: str, query_texts: list[str], n_results: int) -> dict:
+        start = time.perf_counter()
+        embeddings = self.batcher.embed(query_texts)
+        results = self.collections[name].query(
+            query_embeddings = embeddings,
+            n_results = n_results,
+        )
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(time.perf_counter() - start)
+        return {"ids": results["ids"], "documents": results["documents"], "distances": results["distances"]}
+
+    def health(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            requests = self.requests
+        with self.batcher.lock:
+            batches = self.batcher.batches
+            texts = self.batcher.texts
+        return {
+            "status": "ok",
+            "collections": {name: {"id": str(collection.id), "count": collection.count()} for name, collection in self.collections.items()},
+            "stats": {
+                "requests": requests,
+                "embedding_batches": batches,
+                "average_batch_size": texts / batches if batches > 0 else 0,
+                "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if len(latencies) > 0 else None,
+                "latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if len(latencies) > 0 else None,
+            },
+        }
+
+def make_handler(service: RetrievalService) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.send_json(200, service.health())
+            elif self.path.startswith("/collections/"):
+                # Lightweight lookup for clients, /health also counts every collection
+                name = self.path.removeprefix("/collections/")
+                if name not in service.collections:
+                    self.send_json(404, {"error": f"Unknown collection {name}"})
+                    return
+                self.send_json(200, {"name": name, "id": str(service.collections[name].id)})
+            else:
+                self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/query":
+                self.send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if request["collection"] not in service.collections:
+                    self.send_json(404, {"error": f"Unknown collection {request['collection']}"})
+                    return
+                self.send_json(200, service.query(request["collection"], request["query_texts"], request["n_results"]))
+            except Exception as e:
+                self.send_json(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Thin client with the part of the Chroma collection API the apps use
+class RemoteCollection:
+    def __init__(self, url: str, name: str):
+        self.url = url.rstrip("/")
+        self.name = name
+        # Collection id versions the knowledge base (see task3.py)
+        with urllib.request.urlopen(f"{self.url}/collections/{name}", timeout = 10) as response:
+            self.id = json.loads(response.read())["id"]
+
+    def health(self) -> dict:
+        with urllib.request.urlopen(f"{self.url}/health", timeout = 10) as response:
+            return json.loads(response.read())
+
+    def query(self, query_texts: list[str], n_results: int = 10) -> dict:
+        data = json.dumps({"collection": self.name, "query_texts": query_texts, "n_results": n_results}).encode("utf-8")
+        request = urllib.request.Request(f"{self.url}/query", data = data, headers = {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout = 60) as response:
+            return json.loads(response.read())
+
+if __name__ == "__main__":
+    from retrieval import knowledge_bases, open_local_collection
+
+    parser = argparse.ArgumentParser(description = "Serve embedding and retrieval for the local knowledge bases")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--max-batch-size", type = int, default = 64, help = "Maximum number of query texts embedded together")
+    parser.add_argument("--max-wait-ms", type = float, default = 5, help = "How long a query waits for others to join its batch")
+    parser.add_argument("--collections", nargs = "+", default = list(knowledge_bases), choices = list(knowledge_bases), help = "Knowledge bases to serve")
+    args = parser.parse_args()
+
+    # Collections use the storage configured with RETRIEVAL_STORAGE, like the apps.
+    # Knowledge bases which have not been built are skipped so the others can still be served.
+    embedding_function = DefaultEmbeddingFunction()
+    collections = {}
+    for name in args.collections:
+        try:
+            collections[name] = open_local_collection(name, embedding_function)
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+    if len(collections) == 0:
+        raise SystemExit("No knowledge base could be opened")
+    service = RetrievalService(collections, embedding_function, args.max_batch_size, args.max_wait_ms / 1000)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving {list(service.collections)} on http://{args.host}:{args.port}")
+    server.serve_forever()
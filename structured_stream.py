@@ -0,0 +1,36 @@
+import os
+from typing import Callable
+from jiter import from_json
+from openai import OpenAI
+from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
+
+# Streaming mode for structured outputs, set STREAM_STRUCTURED_OUTPUT=0 to wait for the whole JSON instead
+stream_structured_output = os.getenv("STREAM_STRUCTURED_OUTPUT", "1") == "1"
+
+# Parse partial JSON, keeping the incomplete trailing string so text fields can be rendered as they arrive
+def parse_partial(snapshot: str) -> dict:
+    try:
+        partial = from_json(bytes(snapshot, "utf-8"), partial_mode = "trailing-strings")
+    except ValueError:
+        return {}
+    if type(partial) != dict:
+        return {}
+    return partial
+
+# Fields are generated in schema order, so a field is complete once any later field has started
+def get_completed_fields(partial: dict, field_order: list[str]) -> set[str]:
+    completed_fields = set()
+    for index, field in enumerate(field_order):
+        if field in partial and any(later_field in partial for later_field in field_order[index + 1:]):
+            completed_fields.add(field)
+    return completed_fields
+
+# Stream a structured output call, on_partial receives the partial object and the fields completed so far
+def stream_parse(client: OpenAI, on_partial: Callable[[dict, set[str]], None], **kwargs) -> ParsedChatCompletion:
+    field_order = list(kwargs["response_format"].model_fields)
+    with client.beta.chat.completions.stream(**kwargs) as stream:
+        for event in stream:
+            if event.type == "content.delta":
+                partial = parse_partial(event.snapshot)
+                on_partial(partial, get_completed_fields(partial, field_order))
+        return stream.get_final_completion()
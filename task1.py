@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 import streamlit as st
 from openai import OpenAI
+from model_router import ModelRouter
 
 # Get api key and base url from .env file
 load_dotenv()
@@ -23,6 +24,15 @@ client = OpenAI(
     api_key = openai_api_key,
 )
 
+# Route each call to the model configured for it, metrics are shared by every session
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    return ModelRouter(client)
+
+router = get_model_router()
+with st.sidebar.expander("Model routes"):
+    st.json(router.stats())
+
 if prompt := st.chat_input():
     try:
         # Record user input
@@ -30,8 +40,8 @@ if prompt := st.chat_input():
         # Display the input on UI
         st.chat_message("user").write(prompt)
         # Call OpenAI API with history
-        response = client.chat.completions.create(
-            model = "Gpt4o",
+        response = router.create(
+            "generate",
             messages = st.session_state.messages,
         )
         # Get response
@@ -1,16 +1,23 @@
 import os
+import time
 from dotenv import load_dotenv
 import json
 import streamlit as st
-import chromadb
 from pydantic import BaseModel, Field
 from openai import OpenAI
-from openai.types.chat.chat_completion import ChatCompletionMessage
 from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall
+from transcript import Transcript, render_transcript
+from retrieval import get_collection, query_context
+from prompt_layout import record_context, build_messages, format_usage
+from attraction_cache import AttractionCache
+from structured_stream import stream_structured_output
+from gazetteer import Gazetteer
+from model_router import ModelRouter
 
 # Persistent database
-chroma_client = chromadb.PersistentClient(path = "./db/task3/chroma")
-collection = chroma_client.get_collection(name = 'task3')
+collection = get_collection('task3')
+# task3_init.py recreates the collection with a new id, so the id versions the knowledge base
+knowledge_base_version = str(collection.id)
 
 # Get api key and base url from .env file
 load_dotenv()
@@ -19,17 +26,13 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 
 # Basic UI set up
 st.title("📝 Trip planner with OpenAI")
-if "messages" not in st.session_state:
-    st.session_state["messages"] = [
+if "transcript" not in st.session_state:
+    st.session_state["transcript"] = Transcript([
         {"role": "system", "content": "You are an automated trip planning assistant"},
         {"role": "assistant", "content": "Ask me to plan a trip for you."},
-    ]
+    ])
 
-for message in st.session_state.messages:
-    if type(message) == ChatCompletionMessage:
-        message = message.model_dump()
-    if message["role"] != "system" and message["role"] != "tool" and message["content"] != None:
-        st.chat_message(message["role"]).write(message["content"])
+render_transcript(st.session_state.transcript)
 
 # OpenAI client
 client = OpenAI(
@@ -37,6 +40,26 @@ client = OpenAI(
     api_key = openai_api_key,
 )
 
+# Route each call to the model configured for it, metrics are shared by every session
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    return ModelRouter(client)
+
+router = get_model_router()
+with st.sidebar.expander("Model routes"):
+    st.json(router.stats())
+
+# Cache of get_attractions and analyse_input results shared by every session and across restarts
+@st.cache_resource
+def get_attraction_cache() -> AttractionCache:
+    return AttractionCache(
+        path = "./db/task3/attraction_cache.sqlite3",
+        ttl_seconds = float(os.getenv("ATTRACTION_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60)),
+        max_entries = int(os.getenv("ATTRACTION_CACHE_MAX_ENTRIES", 1000)),
+    )
+
+attraction_cache = get_attraction_cache()
+
 locally_stored_documents = [
     "auckland_attraction.pdf",
     "hamilton_waikato_attraction.pdf",
@@ -45,6 +68,13 @@ locally_stored_documents = [
     "tauranga_bay_of_plenty_attraction.pdf",
 ]
 
+# Place names and aliases of the local documents, built by task3_init.py
+@st.cache_resource
+def get_gazetteer() -> Gazetteer:
+    return Gazetteer.load_or_seed(locally_stored_documents)
+
+gazetteer = get_gazetteer()
+
 # Structured output for first LLM call: determine if the input is a trip planning event
 class EventExtraction(BaseModel):
     description: str = Field(description = "Raw description of the event")
@@ -54,6 +84,15 @@ class EventExtraction(BaseModel):
     trip_duration: str = Field(description = "Duration of the trip, if unknown, answer unknown")
     confidence_score: float = Field(description = "Confidence score between 0 and 1")
 
+# Shorter structured output for the first LLM call when the gazetteer has already found locations with local data
+class TripExtraction(BaseModel):
+    description: str = Field(description = "Raw description of the event")
+    is_trip_planning_event: bool = Field(description = "Whether this text describes a trip planning event")
+    local_location: list[str] = Field(description = "Which of the mentioned places with local data are locations of the event, spelled as given")
+    other_location: list[str] = Field(description = "List of other location of the event")
+    trip_duration: str = Field(description = "Duration of the trip, if unknown, answer unknown")
+    confidence_score: float = Field(description = "Confidence score between 0 and 1")
+
 # Structured output for second LLM call
 class Attraction(BaseModel):
     name: str = Field(description = "Name of the attraction")
@@ -149,8 +188,42 @@ tools = [
 
 # First tool LLM can call to determine if input is a trip planning event
 def analyse_input(user_input: str) -> EventExtraction:
-    completion = client.beta.chat.completions.parse(
-        model = "Gpt4o",
+    key = AttractionCache.make_analysis_key(user_input, knowledge_base_version)
+    cached = attraction_cache.get_or_compute(key, lambda: extract_event(user_input))
+    if cached == None:
+        return None
+    return EventExtraction.model_validate_json(cached)
+
+# Classify the input and find its locations, serialised for the cache
+def extract_event(user_input: str) -> str | None:
+    # Places with local data are found by the gazetteer, the LLM classifies the event, confirms which of them are
+    # locations of the event and lists other locations
+    local_locations = gazetteer.find_locations(user_input)
+    if len(local_locations) > 0:
+        completion = router.parse(
+            "classify",
+            messages = [
+                {"role": "system", "content": f"Analyse if the text describes a trip planning event. The text mentions these places with local data: {local_locations}."},
+                {"role": "user", "content": user_input},
+            ],
+            response_format = TripExtraction,
+        )
+        trip = completion.choices[0].message.parsed
+        if trip == None:
+            return None
+        event_locations = [location for location in local_locations if location in trip.local_location]
+        event = EventExtraction(
+            description = trip.description,
+            is_trip_planning_event = trip.is_trip_planning_event,
+            location = event_locations + trip.other_location,
+            should_query_local_data_for_location = [True] * len(event_locations) + [gazetteer.is_local(location) for location in trip.other_location],
+            trip_duration = trip.trip_duration,
+            confidence_score = trip.confidence_score,
+        )
+        return event.model_dump_json()
+
+    completion = router.parse(
+        "classify",
         messages = [
             {"role": "system", "content": f"Analyse if the text describes a trip planning event."},
             {"role": "user", "content": user_input},
@@ -158,10 +231,20 @@ def analyse_input(user_input: str) -> EventExtraction:
         response_format = EventExtraction,
     )
     result = completion.choices[0].message.parsed
-    return result
+    if result == None:
+        return None
+    return result.model_dump_json()
 
 # Second tool LLM can call to get attractions for a location (may or may not use local data)
 def get_attractions(location: str, should_query_local_data: bool) -> AttractionExtraction:
+    key = AttractionCache.make_key(location, should_query_local_data, knowledge_base_version)
+    cached = attraction_cache.get_or_compute(key, lambda: extract_attractions(location, should_query_local_data))
+    if cached == None:
+        return None
+    return AttractionExtraction.model_validate_json(cached)
+
+# Query local data if needed and extract attractions for a location, serialised for the cache
+def extract_attractions(location: str, should_query_local_data: bool) -> str | None:
     message = ''
     if should_query_local_data:
         local_data = query_local_data(location)
@@ -169,13 +252,31 @@ def get_attractions(location: str, should_query_local_data: bool) -> AttractionE
     else:
         message = f"Get attractions in this location: {location}."
     
-    completion = client.beta.chat.completions.parse(
-        model = "Gpt4o",
-        messages = [{"role": "system", "content": message}],
-        response_format = AttractionExtraction,
-    )
+    if stream_structured_output:
+        placeholder = st.empty()
+
+        # List attractions as they are generated
+        def on_partial(partial: dict, completed_fields: set[str]):
+            names = [attraction.get("name") for attraction in partial.get("attractions", []) if type(attraction) == dict and attraction.get("name")]
+            if len(names) > 0:
+                placeholder.markdown("\n".join(f"- {name}" for name in names))
+
+        completion = router.stream_parse(
+            "extract",
+            on_partial,
+            messages = [{"role": "system", "content": message}],
+            response_format = AttractionExtraction,
+        )
+    else:
+        completion = router.parse(
+            "extract",
+            messages = [{"role": "system", "content": message}],
+            response_format = AttractionExtraction,
+        )
     result = completion.choices[0].message.parsed
-    return result
+    if result == None:
+        return None
+    return result.model_dump_json()
 
 # Third tool LLM can call to generate itinerary
 def generate_itinerary(attractions: list[Attraction], duration: str) -> str:
@@ -185,8 +286,8 @@ def generate_itinerary(attractions: list[Attraction], duration: str) -> str:
     else:
         message = f"Generate an itinerary for the following attractions: {attractions}, spread into suitable days."
     
-    completion = client.chat.completions.create(
-        model = "Gpt4o",
+    completion = router.create(
+        "generate",
         messages = [{"role": "system", "content": message}],
     )
     result = completion.choices[0].message.content
@@ -196,8 +297,8 @@ def generate_itinerary(attractions: list[Attraction], duration: str) -> str:
 def get_trip_summary(user_input: str, itinerary: str) -> str:
     message = f"Using the itinerary: {itinerary}.\n\nSummarise a natural language response to the user's goal: {user_input}."
 
-    completion = client.chat.completions.create(
-        model = "Gpt4o",
+    completion = router.create(
+        "summarize",
         messages = [{"role": "system", "content": message}],
     )
     result = completion.choices[0].message.content
@@ -205,14 +306,7 @@ def get_trip_summary(user_input: str, itinerary: str) -> str:
 
 # Optional to query local data
 def query_local_data(location: str) -> str:
-    local_data = ''
-    query_results = collection.query(
-        query_texts = [location],
-        n_results = 20,
-    )
-    documents = collection.get(ids = query_results['ids'][0])['documents']
-    for chunk in documents:
-        local_data += f"""{chunk}\n\n"""
+    _, local_data = query_context(collection, [location])[0]
     return local_data
 
 # Helper function to make tool call
@@ -232,6 +326,9 @@ def make_tool_calls(tool_calls: list[ChatCompletionMessageToolCall]):
     for tool_call in tool_calls:
         name = tool_call.function.name
         args = json.loads(tool_call.function.arguments)
+        # Locations which are a place the gazetteer knows always use local data, others keep the model's choice
+        if name == 'get_attractions' and gazetteer.is_local(args['location']):
+            args['should_query_local_data'] = True
 
         step_message = ''
         if name == 'get_attractions' and args['should_query_local_data']:
@@ -252,42 +349,50 @@ def make_tool_calls(tool_calls: list[ChatCompletionMessageToolCall]):
         elif type(function_result) == AttractionExtraction:
             function_result = function_result.model_dump()
         
-        st.session_state.messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": json.dumps(function_result)})
+        st.session_state.transcript.append({"role": "tool", "tool_call_id": tool_call.id, "content": json.dumps(function_result)})
 
     for step_message in step_messages:
-        st.session_state.messages.append({"role": "assistant", "content": step_message})
+        st.session_state.transcript.append({"role": "assistant", "content": step_message})
 
 if prompt := st.chat_input():
     try:
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.transcript.append({"role": "user", "content": prompt})
         st.chat_message("user").write(prompt)
 
         sys_message = f"User wants to achieve the goal of {prompt}. Start with calling analyse_input if you haven't, break it down into steps, in each step, only use tools provided."
-        st.session_state.messages.append({"role": "system", "content": sys_message})
-        completion = client.chat.completions.create(
-            model = "Gpt4o",
-            messages = st.session_state.messages,
+        local_locations = gazetteer.find_locations(prompt)
+        if len(local_locations) > 0:
+            sys_message += f" These places mentioned have local data, call get_attractions with should_query_local_data true for those which are locations of the trip: {local_locations}."
+        # Keep the per-prompt goal at the tail so the system prompt, tool schemas and history stay a cacheable prefix
+        tail = record_context(st.session_state.transcript, [{"role": "system", "content": sys_message}])
+        start = time.perf_counter()
+        completion = router.create(
+            "generate",
+            messages = build_messages(st.session_state.transcript, tail),
             tools = tools,
         )
+        usages = [completion.usage]
         result = completion.choices[0].message.content
 
         max_steps = 20
         step = 1
         
         while result == None and step <= max_steps:
-            completion = client.chat.completions.create(
-                model = "Gpt4o",
-                messages = st.session_state.messages,
+            completion = router.create(
+                "generate",
+                messages = build_messages(st.session_state.transcript, tail),
                 tools = tools,
             )
+            usages.append(completion.usage)
             step += 1
             result = completion.choices[0].message.content
             if completion.choices[0].message.tool_calls != None:
-                st.session_state.messages.append(completion.choices[0].message)
+                st.session_state.transcript.append(completion.choices[0].message)
                 make_tool_calls(completion.choices[0].message.tool_calls)
         
-        st.session_state.messages.append({"role": "assistant", "content": result})
+        st.session_state.transcript.append({"role": "assistant", "content": result})
         st.chat_message("assistant").write(result)
+        st.caption(format_usage(usages, time.perf_counter() - start))
     except Exception as e:
         st.error(f"Error: {e}")
         st.stop()
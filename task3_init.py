@@ -1,12 +1,25 @@
+import os
+import argparse
 import chromadb
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_community.document_loaders import TextLoader
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.embeddings.sentence_transformer import SentenceTransformerEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from ingest import stream_ingest
+from gazetteer import find_place_names, build_entries, save_entries
+
+parser = argparse.ArgumentParser(description = "Build the task3 knowledge base")
+parser.add_argument("--stream", action = "store_true", help = "Ingest page by page in fixed-size batches with bounded memory")
+parser.add_argument("--resume", action = "store_true", help = "With --stream, continue from the last committed batch instead of rebuilding")
+parser.add_argument("--batch-size", type = int, default = 64, help = "Number of chunks embedded and upserted together")
+parser.add_argument("--max-memory-mb", type = float, default = 1024, help = "Soft memory ceiling for the streaming pipeline, batches shrink above it")
+args = parser.parse_args()
 
 chroma_client = chromadb.PersistentClient(path = "./db/task3/chroma", settings = chromadb.Settings(allow_reset=True))
-chroma_client.reset()
+if not (args.stream and args.resume):
+    chroma_client.reset()
 embedding_function = SentenceTransformerEmbeddings(model_name = "all-MiniLM-L6-v2")
 file_paths = [
     "knowledge_base/task3/auckland_attraction.pdf",
@@ -15,22 +28,45 @@ file_paths = [
     "knowledge_base/task3/taupo_attraction.pdf",
     "knowledge_base/task3/tauranga_bay_of_plenty_attraction.pdf",
 ]
+# Place names found in each document, for the gazetteer task3.py uses to route locations to local data
+place_names_by_document = {}
+
+def record_place_names(file_path: str, page: Document):
+    place_names_by_document.setdefault(os.path.basename(file_path), set()).update(find_place_names(page.page_content))
 
-for file_path in file_paths:
-    if file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
-        document = loader.load()
-    elif file_path.endswith(".txt"):
-        loader = TextLoader(file_path)
-        document = loader.load()
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size = 1000, chunk_overlap = 100)
-    chunked_documents = text_splitter.split_documents(document)
-
-    Chroma.from_documents(
+if args.stream:
+    stream_ingest(
+        file_paths,
         collection_name = "task3",
-        persist_directory = "./db/task3/chroma",
-        documents = chunked_documents,
-        embedding = embedding_function,
         client = chroma_client,
+        embedding_function = embedding_function,
+        checkpoint_path = "./db/task3/ingest_checkpoint.json",
+        batch_size = args.batch_size,
+        max_memory_mb = args.max_memory_mb,
+        resume = args.resume,
+        on_page = record_place_names,
     )
+else:
+    for file_path in file_paths:
+        if file_path.endswith(".pdf"):
+            loader = PyPDFLoader(file_path)
+            document = loader.load()
+        elif file_path.endswith(".txt"):
+            loader = TextLoader(file_path)
+            document = loader.load()
+
+        for page in document:
+            record_place_names(file_path, page)
+
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size = 1000, chunk_overlap = 100)
+        chunked_documents = text_splitter.split_documents(document)
+
+        Chroma.from_documents(
+            collection_name = "task3",
+            persist_directory = "./db/task3/chroma",
+            documents = chunked_documents,
+            embedding = embedding_function,
+            client = chroma_client,
+        )
+
+save_entries(build_entries(place_names_by_document))
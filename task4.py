@@ -3,8 +3,10 @@ from dotenv import load_dotenv
 import streamlit as st
 from pydantic import BaseModel, Field
 from openai import OpenAI
-from openai.types.chat.chat_completion import ChatCompletionMessage
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+from transcript import Transcript, render_transcript
+from intent_classifier import IntentClassifier, model_path, confidence_threshold, log_decision
+from model_router import ModelRouter
 
 # Get api key and base url from .env file
 load_dotenv()
@@ -13,17 +15,13 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 
 # Basic UI set up
 st.title("📝 Dynamic Document Generator with OpenAI")
-if "messages" not in st.session_state:
-    st.session_state["messages"] = [
+if "transcript" not in st.session_state:
+    st.session_state["transcript"] = Transcript([
         {"role": "system", "content": "You are an automated dynamic document generator assistant"},
         {"role": "assistant", "content": "Ask me to generate a document for you."},
-    ]
+    ])
 
-for message in st.session_state.messages:
-    if type(message) == ChatCompletionMessage:
-        message = message.model_dump()
-    if message["role"] != "system":
-        st.chat_message(message["role"]).write(message["content"])
+render_transcript(st.session_state.transcript)
 
 # OpenAI client
 client = OpenAI(
@@ -31,6 +29,15 @@ client = OpenAI(
     api_key = openai_api_key,
 )
 
+# Route each call to the model configured for it, metrics are shared by every session
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    return ModelRouter(client)
+
+router = get_model_router()
+with st.sidebar.expander("Model routes"):
+    st.json(router.stats())
+
 # Structured output for first LLM call: determine if the input is a document event
 class EventExtraction(BaseModel):
     description: str = Field(description = "Raw description of the latest user input")
@@ -56,19 +63,50 @@ class ComparisonResult(BaseModel):
 def analyse_input(messages: list[ChatCompletionMessageParam]) -> EventExtraction:
     messages = messages.copy()
     messages.append({"role": "system", "content": f"Analyse if the latest user input describes a new document generating event or a change event for a document generated, cannot be both true at the same time."})
-    completion = client.beta.chat.completions.parse(
-        model = "Gpt4o",
+    completion = router.parse(
+        "classify",
         messages = messages,
         response_format = EventExtraction,
     )
     result = completion.choices[0].message.parsed
     return result
 
+# Local intent classifier trained from logged analyse_input decisions, None until intent_classifier.py train has been run.
+# Cached by the model file's modification time, so a retrained model is picked up without a restart.
+# A model with a single label is always confident, so it is ignored.
+@st.cache_resource(max_entries = 1)
+def get_intent_classifier(model_modified: float | None) -> IntentClassifier | None:
+    if model_modified == None:
+        return None
+    classifier = IntentClassifier.load(model_path)
+    if len(classifier.labels) < 2:
+        return None
+    return classifier
+
+intent_classifier = get_intent_classifier(os.path.getmtime(model_path) if os.path.exists(model_path) else None)
+
+# Classify the latest user input locally, falling back to the LLM when the local classifier is not confident
+def classify_input(user_input: str) -> EventExtraction:
+    if intent_classifier != None:
+        label, confidence = intent_classifier.predict_text(user_input)
+        # A change event needs a document generated earlier in this conversation, otherwise let the LLM decide
+        if confidence >= confidence_threshold and (label != "change_document" or st.session_state.get("has_document", False)):
+            return EventExtraction(
+                description = user_input,
+                is_new_document_event = label == "new_document",
+                is_change_document_event = label == "change_document",
+                confidence_score = confidence,
+            )
+
+    result = analyse_input(st.session_state.transcript.messages())
+    log_decision(user_input, result.is_new_document_event, result.is_change_document_event, result.confidence_score)
+    return result
+
 # Second LLM call to extract specific requirements in user input
 def extract_requirements(user_input: str) -> NewDocumentEvent:
     message = [{"role": "system", "content": f"Extract all the specific requirements in the given the user input: {user_input}."}]
-    completion = client.beta.chat.completions.parse(
-        model = "Gpt4o",
+    completion = router.parse(
+        "extract",
         messages = message,
         response_format = NewDocumentEvent,
     )
@@ -78,27 +116,28 @@ def extract_requirements(user_input: str) -> NewDocumentEvent:
 if prompt := st.chat_input():
     try:
         # Step 1 record user input and analyse it
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.transcript.append({"role": "user", "content": prompt})
         st.chat_message("user").write(prompt)
 
         # Step 2 analyse user input
-        result = analyse_input(st.session_state.messages)
-        if (result.is_new_document_event == False and result.is_change_document_event == False) or result.confidence_score < 0.7:
+        result = classify_input(prompt)
+        if (result.is_new_document_event == False and result.is_change_document_event == False) or result.confidence_score < confidence_threshold:
             st.info(f"The input is not a document event.")
             st.stop()
 
         # Step 3 extract requirements
         if result.is_new_document_event:
             requirements = extract_requirements(prompt)
-            st.session_state.messages.append({"role": "system", "content": f"Given the user input: {prompt}\n\nGenerate document, make sure its length satisfy \"{requirements.document_length}\", its style is in \"{requirements.document_style}\" and includes keywords of \"{requirements.key_words}\""})
+            st.session_state.transcript.append({"role": "system", "content": f"Given the user input: {prompt}\n\nGenerate document, make sure its length satisfy \"{requirements.document_length}\", its style is in \"{requirements.document_style}\" and includes keywords of \"{requirements.key_words}\""})
         
         # Step 4 - Third LLM call to generate the draft
-        completion = client.chat.completions.create(
-            model = "Gpt4o",
-            messages = st.session_state.messages,
+        completion = router.create(
+            "generate",
+            messages = st.session_state.transcript.messages(),
         )
         draft = completion.choices[0].message.content
-        st.session_state.messages.append({"role": "assistant", "content": draft})
+        st.session_state.transcript.append({"role": "assistant", "content": draft})
+        st.session_state["has_document"] = True
         st.chat_message("assistant").write(draft)
     except Exception as e:
         st.error(f"Error: {e}")
@@ -1,23 +1,38 @@
 import os
 from dotenv import load_dotenv
 import json
+import tempfile
 import streamlit as st
 from pydantic import BaseModel, Field
 from openai import OpenAI
-from openai.types.chat.chat_completion import ChatCompletionMessage
 from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall
 from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
-from subprocess import run
+from subprocess import Popen, PIPE, TimeoutExpired
+from transcript import Transcript, render_transcript
+from structured_stream import stream_structured_output
+from model_router import ModelRouter
 
 # Get api key and base url from .env file
 load_dotenv()
 openai_base_url = os.getenv("OPENAI_BASE_URL")
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
+# Display text for a message, answers stored as EventExtraction JSON only show general_output
+def render_message(message: dict) -> str | None:
+    content = message.get("content")
+    if message["role"] == "system" or message["role"] == "tool" or content == None:
+        return None
+    if not content.startswith("{"):
+        return content
+    try:
+        return json.loads(content)["general_output"]
+    except Exception as e:
+        return content
+
 # Basic UI set up
 st.title("📝 OpenAI Python Coding Assistant")
-if "messages" not in st.session_state:
-    st.session_state["messages"] = [{"role": "system", "content": "You are a Python AI coding assistant, you only know Python. When generating any code, always make the code excecutable and includes different inputs as examples. Print statements should have new line at the end."}]
+if "transcript" not in st.session_state:
+    st.session_state["transcript"] = Transcript([{"role": "system", "content": "You are a Python AI coding assistant, you only know Python. When generating any code, always make the code excecutable and includes different inputs as examples. Print statements should have new line at the end."}], render = render_message)
 
 # Structured output for first LLM call: determine if the input is a document event
 class EventExtraction(BaseModel):
@@ -26,24 +41,7 @@ class EventExtraction(BaseModel):
     general_output: str = Field(description = "Answer which will be displayed to the user, including any code generated")
     confidence_score: float = Field(description = "Confidence score between 0 and 1")
 
-for message in st.session_state.messages:
-    if type(message) == ChatCompletionMessage:
-        message = message.model_dump()
-    elif type(message) != dict:
-        try:
-            message = message.model_dump()
-        except Exception as e:
-            st.error(f"Error: {e}")
-    
-    if type(message) == dict:
-        if message["role"] != "system" and message["role"] != "tool" and message["content"] != None:
-            try:
-                parsed = json.loads(message["content"])
-                general_output = parsed["general_output"]
-                if general_output != None:
-                    st.chat_message(message["role"]).write(general_output)
-            except Exception as e:
-                st.chat_message(message["role"]).write(message["content"])
+render_transcript(st.session_state.transcript)
 
 # OpenAI client
 client = OpenAI(
@@ -51,6 +49,15 @@ client = OpenAI(
     api_key = openai_api_key,
 )
 
+# Route each call to the model configured for it, metrics are shared by every session
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    return ModelRouter(client)
+
+router = get_model_router()
+with st.sidebar.expander("Model routes"):
+    st.json(router.stats())
+
 # Tools available to LLM
 tools = [
     {
@@ -95,58 +102,137 @@ def make_tool_calls(tool_calls: list[ChatCompletionMessageToolCall]):
 
         function_result = call_function(name, args)
         
-        st.session_state.messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": json.dumps(function_result)})
+        st.session_state.transcript.append({"role": "tool", "tool_call_id": tool_call.id, "content": json.dumps(function_result)})
 
     for step_message in step_messages:
-        st.session_state.messages.append({"role": "assistant", "content": step_message})
+        st.session_state.transcript.append({"role": "assistant", "content": step_message})
 
-def handle_result(result: EventExtraction):
-    st.session_state.messages.append({"role": "assistant", "content": result.general_output})
-    st.chat_message("assistant").write(result.general_output)
+def write_code(code: str, path: str):
+    with open(path, "w") as file:
+        file.write(code)
+        file.close()
+
+# Write generated code to output.py, or another path while the answer is still streaming, and start running it
+def start_code(code: str, path: str = "output.py") -> Popen | None:
+    write_code(code, path)
+    try:
+        if os.path.exists(path):
+            os.chmod(path, 0o755)
+            st.info(f"Excecuting code...")
+            return Popen(["python", path], stdout = PIPE, stderr = PIPE)
+        else:
+            print("File not found:", path)
+    except PermissionError:
+        print("Permission denied: You don't have the necessary permissions to change the permissions of this file.")
+    return None
+
+# Wait for generated code to finish and display its output
+def finish_code(process: Popen):
+    try:
+        stdout, _ = process.communicate(timeout = 30)
+    except TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise
+    output = stdout.decode("utf-8")
+    st.info(f"Finished running")
+    st.info(f"You may find the code in output.py.\n\nExcecuted code, output:\n\n{output}")
+
+# Stop generated code which is still running
+def stop_code(process: Popen):
+    if process.poll() == None:
+        process.kill()
+        process.communicate()
+
+# Record and display the answer, code may already be running if it was completed while streaming
+def handle_result(result: EventExtraction, placeholder = None, process: Popen | None = None):
+    st.session_state.transcript.append({"role": "assistant", "content": result.general_output})
+    if placeholder != None:
+        placeholder.write(result.general_output)
+    else:
+        st.chat_message("assistant").write(result.general_output)
     if result.generated_code != '':
-        with open("output.py", "w") as file:
-            file.write(result.generated_code)
-            file.close()
-        try:
-            if os.path.exists("./output.py"):
-                os.chmod("./output.py", 0o755)
-                st.info(f"Excecuting code...")
-                output = run(["python", "output.py"], capture_output = True, timeout = 30).stdout.decode("utf-8")
-                st.info(f"Finished running")
-                st.info(f"You may find the code in output.py.\n\nExcecuted code, output:\n\n{output}")
-            else:
-                print("File not found:", "./output.py")
-        except PermissionError:
-            print("Permission denied: You don't have the necessary permissions to change the permissions of this file.")
+        if process == None:
+            process = start_code(result.generated_code)
+        else:
+            write_code(result.generated_code, "output.py")
+        if process != None:
+            finish_code(process)
 
 def call_llm() -> ParsedChatCompletion[EventExtraction]:
-    completion = client.beta.chat.completions.parse(
-        model = "Gpt4o",
-        messages = st.session_state.messages,
-        response_format = EventExtraction,
-        tools = tools,
-    )
-    result = completion.choices[0].message.parsed
-    if result != None:
-        handle_result(result = result)
+    if not stream_structured_output:
+        completion = router.parse(
+            "generate",
+            messages = st.session_state.transcript.messages(),
+            response_format = EventExtraction,
+            tools = tools,
+        )
+        result = completion.choices[0].message.parsed
+        if result != None:
+            handle_result(result = result)
+        return completion
+
+    placeholder = None
+    process = None
+    streamed_code = None
+    streamed_path = None
+    # Code from an attempt the router may reject and escalate is not run early
+    start_early = not router.can_escalate("generate")
+
+    # Render general_output as it arrives and start generated_code as soon as that field is complete
+    def on_partial(partial: dict, completed_fields: set[str]):
+        nonlocal placeholder, process, streamed_code, streamed_path
+        general_output = partial.get("general_output")
+        if general_output:
+            if placeholder == None:
+                placeholder = st.chat_message("assistant").empty()
+            placeholder.write(general_output)
+        if start_early and "generated_code" in completed_fields and streamed_code == None:
+            streamed_code = partial["generated_code"]
+            if streamed_code != '':
+                # output.py is only replaced once the answer is complete
+                file, streamed_path = tempfile.mkstemp(suffix = ".py")
+                os.close(file)
+                process = start_code(streamed_code, streamed_path)
+
+    try:
+        completion = router.stream_parse(
+            "generate",
+            on_partial,
+            messages = st.session_state.transcript.messages(),
+            response_format = EventExtraction,
+            tools = tools,
+        )
+        result = completion.choices[0].message.parsed
+        if process != None and (result == None or result.generated_code != streamed_code):
+            stop_code(process)
+            process = None
+        if result != None:
+            handle_result(result = result, placeholder = placeholder, process = process)
+    finally:
+        # Code started early is stopped if the stream failed or the script was interrupted before it finished
+        if process != None:
+            stop_code(process)
+        if streamed_path != None and os.path.exists(streamed_path):
+            os.remove(streamed_path)
 
     return completion
 
 if prompt := st.chat_input():
     try:
         st.chat_message("user").write(prompt)
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.transcript.append({"role": "user", "content": prompt})
         
         completion = call_llm()
         
         if completion.choices[0].message.tool_calls != None and len(completion.choices[0].message.tool_calls) > 0:
-            st.session_state.messages.append(completion.choices[0].message)
+            st.session_state.transcript.append(completion.choices[0].message)
             make_tool_calls(completion.choices[0].message.tool_calls)
             call_llm()
         
         if completion.choices[0].message.tool_calls != None and len(completion.choices[0].message.tool_calls) == 0:
             completion.choices[0].message.tool_calls = None
-            st.session_state.messages.append(completion.choices[0].message)
+            st.session_state.transcript.append(completion.choices[0].message)
 
     except Exception as e:
         st.error(f"Error: {e}")
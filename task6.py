@@ -1,13 +1,15 @@
 import os
+import time
 from dotenv import load_dotenv
 import streamlit as st
-import chromadb
 from openai import OpenAI
-from openai.types.chat.chat_completion import ChatCompletionMessage
+from transcript import Transcript, render_transcript
+from retrieval import knowledge_bases, get_collection, query_context, context_message
+from prompt_layout import record_context, build_messages, format_usage
+from model_router import ModelRouter
 
 # Persistent database
-chroma_client = chromadb.PersistentClient(path = "./db/task6/chroma")
-collection = chroma_client.get_collection(name = 'task6')
+collection = get_collection('task6')
 
 # Get api key and base url from .env file
 load_dotenv()
@@ -16,17 +18,13 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 
 # Basic UI set up
 st.title("📝 Front-end Innovation Q&A with OpenAI")
-if "messages" not in st.session_state:
-    st.session_state["messages"] = [
-        {"role": "system", "content": "You're a helpful assistant which answer questions about Front-end Innovation team."},
+if "transcript" not in st.session_state:
+    st.session_state["transcript"] = Transcript([
+        {"role": "system", "content": knowledge_bases["task6"]["system_prompt"]},
         {"role": "assistant", "content": "Ask something about the Front-end Innovation team"}
-    ]
+    ])
 
-for message in st.session_state.messages:
-    if type(message) == ChatCompletionMessage:
-        message = message.model_dump()
-    if message["role"] != "system":
-        st.chat_message(message["role"]).write(message["content"])
+render_transcript(st.session_state.transcript)
 
 # OpenAI client
 client = OpenAI(
@@ -34,39 +32,42 @@ client = OpenAI(
     api_key = openai_api_key,
 )
 
+# Route each call to the model configured for it, metrics are shared by every session
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    return ModelRouter(client)
+
+router = get_model_router()
+with st.sidebar.expander("Model routes"):
+    st.json(router.stats())
+
 if prompt := st.chat_input():
     try:
         # Record user input
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.transcript.append({"role": "user", "content": prompt})
         # Display the input on UI
         st.chat_message("user").write(prompt)
 
         # Query local data
-        results = collection.query(
-            query_texts = [prompt],
-            n_results = 20,
-        )
-        documents = collection.get(ids = results['ids'][0])['documents']
-        context = ''
-        for chunk in documents:
-            context += f"""{chunk}\n\n"""
+        _, context = query_context(collection, [prompt])[0]
 
-        # Instruction to LLM, specifically ask LLM to answer only using context provided
-        message = f"Answer the question using only the context provided.\n\nQuestion: {prompt}\nContext:\n\n{context}\n"
-        # Record system instruction
-        st.session_state.messages.append({"role": "system", "content": message})
+        # Keep system instruction with retrieved context at the tail so the history prefix can be cached
+        tail = record_context(st.session_state.transcript, [context_message(prompt, context)])
 
         # Call OpenAI API with history
-        response = client.chat.completions.create(
-            model = "Gpt4o",
-            messages = st.session_state.messages,
+        start = time.perf_counter()
+        response = router.create(
+            "generate",
+            messages = build_messages(st.session_state.transcript, tail),
         )
+        elapsed = time.perf_counter() - start
         # Get response
         result = response.choices[0].message.content
         # Record response
-        st.session_state.messages.append({"role": "assistant", "content": result})
+        st.session_state.transcript.append({"role": "assistant", "content": result})
         # Write response to history
         st.chat_message("assistant").write(result)
+        st.caption(format_usage([response.usage], elapsed))
     except Exception as e:
         st.error(f"Error: {e}")
         st.stop()
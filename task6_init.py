@@ -1,12 +1,22 @@
+import argparse
 import chromadb
 from langchain_chroma import Chroma
 from langchain_community.document_loaders import TextLoader
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.embeddings.sentence_transformer import SentenceTransformerEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from ingest import stream_ingest
+
+parser = argparse.ArgumentParser(description = "Build the task6 knowledge base")
+parser.add_argument("--stream", action = "store_true", help = "Ingest page by page in fixed-size batches with bounded memory")
+parser.add_argument("--resume", action = "store_true", help = "With --stream, continue from the last committed batch instead of rebuilding")
+parser.add_argument("--batch-size", type = int, default = 64, help = "Number of chunks embedded and upserted together")
+parser.add_argument("--max-memory-mb", type = float, default = 1024, help = "Soft memory ceiling for the streaming pipeline, batches shrink above it")
+args = parser.parse_args()
 
 chroma_client = chromadb.PersistentClient(path = "./db/task6/chroma", settings = chromadb.Settings(allow_reset = True))
-chroma_client.reset()
+if not (args.stream and args.resume):
+    chroma_client.reset()
 embedding_function = SentenceTransformerEmbeddings(model_name = "all-MiniLM-L6-v2")
 file_paths = [
     "knowledge_base/task6/team_info.txt",
@@ -16,21 +26,33 @@ file_paths = [
     "knowledge_base/task6/cv_jesse.pdf",
 ]
 
-for file_path in file_paths:
-    if file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
-        document = loader.load()
-    elif file_path.endswith(".txt"):
-        loader = TextLoader(file_path)
-        document = loader.load()
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size = 1000, chunk_overlap = 100)
-    chunked_documents = text_splitter.split_documents(document)
-
-    Chroma.from_documents(
+if args.stream:
+    stream_ingest(
+        file_paths,
         collection_name = "task6",
-        persist_directory = "./db/task6/chroma",
-        documents = chunked_documents,
-        embedding = embedding_function,
         client = chroma_client,
+        embedding_function = embedding_function,
+        checkpoint_path = "./db/task6/ingest_checkpoint.json",
+        batch_size = args.batch_size,
+        max_memory_mb = args.max_memory_mb,
+        resume = args.resume,
     )
+else:
+    for file_path in file_paths:
+        if file_path.endswith(".pdf"):
+            loader = PyPDFLoader(file_path)
+            document = loader.load()
+        elif file_path.endswith(".txt"):
+            loader = TextLoader(file_path)
+            document = loader.load()
+
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size = 1000, chunk_overlap = 100)
+        chunked_documents = text_splitter.split_documents(document)
+
+        Chroma.from_documents(
+            collection_name = "task6",
+            persist_directory = "./db/task6/chroma",
+            documents = chunked_documents,
+            embedding = embedding_function,
+            client = chroma_client,
+        )
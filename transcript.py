@@ -0,0 +1,92 @@
+import streamlit as st
+from dataclasses import dataclass
+from typing import Callable, Iterator
+from pydantic import BaseModel
+
+# Message keys the API needs back, everything else on ChatCompletionMessage objects is dropped on insert
+message_keys = ("role", "content", "tool_calls", "tool_call_id", "name")
+
+# Number of messages displayed on a rerun, and how many more each "Show older messages" click loads
+window_size = 20
+
+# One message in the transcript, display caches the rendered text (None if the message is not shown)
+@dataclass(slots = True)
+class TranscriptRecord:
+    role: str
+    message: dict
+    display: str | None
+
+# Default rendering, system and tool messages and messages without content are not shown
+def render_content(message: dict) -> str | None:
+    if message["role"] == "system" or message["role"] == "tool" or message.get("content") == None:
+        return None
+    return message["content"]
+
+# Convert a dict or ChatCompletionMessage into a compact message dict for the API
+def normalize_message(message: dict | BaseModel) -> dict:
+    if isinstance(message, BaseModel):
+        message = message.model_dump()
+
+    normalized = {}
+    for key in message_keys:
+        value = message.get(key)
+        if value != None and value != []:
+            normalized[key] = value
+
+    if "tool_calls" in normalized:
+        normalized["tool_calls"] = [
+            {
+                "id": tool_call["id"],
+                "type": tool_call["type"],
+                "function": {"name": tool_call["function"]["name"], "arguments": tool_call["function"]["arguments"]},
+            }
+            for tool_call in normalized["tool_calls"]
+        ]
+    return normalized
+
+# Chat history normalised once on insert, with cached display text for each message
+class Transcript:
+    def __init__(self, messages: list[dict], render: Callable[[dict], str | None] = render_content):
+        self.render = render
+        self.records: list[TranscriptRecord] = []
+        # Indices of records which have display text
+        self.visible: list[int] = []
+        self.extend(messages)
+
+    def append(self, message: dict | BaseModel):
+        normalized = normalize_message(message)
+        record = TranscriptRecord(role = normalized["role"], message = normalized, display = self.render(normalized))
+        if record.display != None:
+            self.visible.append(len(self.records))
+        self.records.append(record)
+
+    def extend(self, messages: list[dict | BaseModel]):
+        for message in messages:
+            self.append(message)
+
+    # Messages to send to the API
+    def messages(self) -> list[dict]:
+        return [record.message for record in self.records]
+
+    def __iter__(self) -> Iterator[dict]:
+        return (record.message for record in self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+def show_older_messages():
+    st.session_state["transcript_window"] += window_size
+
+# Display the most recent window of the transcript, older messages are loaded on demand
+def render_transcript(transcript: Transcript):
+    if "transcript_window" not in st.session_state:
+        st.session_state["transcript_window"] = window_size
+    window = st.session_state["transcript_window"]
+
+    hidden = len(transcript.visible) - window
+    if hidden > 0:
+        st.button(f"Show {min(hidden, window_size)} older messages", on_click = show_older_messages)
+
+    for index in transcript.visible[max(hidden, 0):]:
+        record = transcript.records[index]
+        st.chat_message(record.role).write(record.display)